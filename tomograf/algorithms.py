@@ -2,6 +2,13 @@ import numpy as np
 from PIL import Image
 from scipy import ndimage
 
+# Domyślny typ danych obliczeń; float64 można wybrać parametrem dtype
+DEFAULT_DTYPE = np.float32
+
+def count_dtype(max_count):
+    # Najmniejszy typ całkowity mieszczący liczbę promieni przez piksel
+    return np.min_scalar_type(max_count)
+
 def apply_filter(image):
     kernel = np.array([[1,1,1],
                        [1,15,1],
@@ -10,15 +17,8 @@ def apply_filter(image):
 
     image = image.astype(np.float32)
 
-    padded = np.pad(image, 1, mode='reflect')
-    filtered = np.zeros_like(image, dtype=np.float32)
-
-    rows, cols = image.shape
-    for i in range(rows):
-        for j in range(cols):
-            region = padded[i:i+3, j:j+3]
-            filtered[i, j] = np.sum(region * kernel)
-    return filtered
+    # 'mirror' w ndimage odpowiada np.pad(..., mode='reflect')
+    return ndimage.correlate(image, kernel, mode='mirror')
 
 def circle_coords(angle_shift, angle_range, count, radius=1, center=(0, 0)):
     angles = np.linspace(0, angle_range, count) + angle_shift
@@ -51,27 +51,77 @@ def bresenham(x0, y0, x1, y1):
         xs, ys = ys, xs
     return np.array([xs, ys])
 
+def clipped_lines(emitters, detectors, lo, hi):
+    """
+    Piksele wszystkich linii emiter-detektor (te same co bresenham) leżące
+    w prostokącie lo..hi (włącznie), liczone naraz dla całego skanu.
+    Linie omijające prostokąt są odrzucane przed rasteryzacją, a pozostałe
+    rasteryzowane tylko na odcinku osi głównej w prostokącie.
+    Zwraca (xs, ys, numery linii).
+    """
+    x0, y0 = emitters[:, 0].astype(float), emitters[:, 1].astype(float)
+    x1, y1 = detectors[:, 0].astype(float), detectors[:, 1].astype(float)
+    # Oś główna (a) i poboczna (b) jak w bresenham
+    steep = np.abs(y1 - y0) > np.abs(x1 - x0)
+    a0, b0 = np.where(steep, y0, x0), np.where(steep, x0, y0)
+    a1, b1 = np.where(steep, y1, x1), np.where(steep, x1, y1)
+    lo_a, lo_b = np.where(steep, lo[1], lo[0]), np.where(steep, lo[0], lo[1])
+    hi_a, hi_b = np.where(steep, hi[1], hi[0]), np.where(steep, hi[0], hi[1])
+
+    da = a1 - a0
+    m = np.divide(b1 - b0, da, out=np.ones_like(da), where=da != 0)
+    q = b0 - m * a0
+    start = np.maximum(np.floor(np.minimum(a0, a1)), lo_a)
+    stop = np.minimum(np.ceil(np.maximum(a0, a1)), hi_a)
+
+    # Odrzuć linie, które nie przecinają prostokąta
+    b_start, b_stop = np.round(m * start + q), np.round(m * stop + q)
+    hit = (stop >= start) & (np.maximum(b_start, b_stop) >= lo_b) & (np.minimum(b_start, b_stop) <= hi_b)
+    rays = np.flatnonzero(hit)
+    counts = (stop[rays] - start[rays] + 1).astype(int)
+
+    ray_ids = np.repeat(rays, counts)
+    steps = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    a = start[ray_ids].astype(int) + steps
+    b = np.round(m[ray_ids] * a + q[ray_ids]).astype(int)
+    inside = (b >= lo_b[ray_ids]) & (b <= hi_b[ray_ids])
+    a, b, ray_ids = a[inside], b[inside], ray_ids[inside]
+    swapped = steep[ray_ids]
+    return np.where(swapped, b, a), np.where(swapped, a, b), ray_ids
+
 def draw_lines(emitters, detectors):
     lines = list()
     for (x0, y0), (x1, y1) in zip(emitters, detectors):
         lines.append(np.array(bresenham(x0, y0, x1, y1)))
     return lines
 
-def image_pad(array):
-    w, h = array.shape
+def pad_shape(shape):
+    w, h = shape
     side = int(np.ceil((w**2 + h**2)**0.5))
-    shape = (side, side)
+    return (side, side)
+
+def image_pad(array):
+    shape = pad_shape(array.shape)
     pad = (np.array(shape) - np.array(array.shape)) / 2
     pad = np.array([np.floor(pad), np.ceil(pad)]).T.astype(int)
     return np.pad(array, pad)
 
-def rescale(array):
-    res = array.astype('float32')
+def rescale(array, dtype=DEFAULT_DTYPE, in_place=False):
+    res = array if in_place else array.astype(dtype)
     res -= np.min(res)
     max_val = np.max(res)
     if max_val > 0:
         res /= max_val
-    return res * 255
+    res *= 255
+    return res
+
+def rescale_rows(array):
+    # rescale osobno dla każdego wiersza (ostatnia oś), w miejscu
+    array -= np.min(array, axis=-1, keepdims=True)
+    max_val = np.max(array, axis=-1, keepdims=True)
+    np.divide(array, max_val, out=array, where=max_val > 0)
+    array *= 255
+    return array
 
 def unpad(img, height, width):
     y, x = img.shape
@@ -79,23 +129,23 @@ def unpad(img, height, width):
     starty = y//2 - (height//2)
     return img[starty:starty+height, startx:startx+width]
 
-def radon(detector_count, angle_range, image, radius, center, alpha):
+def radon(detector_count, angle_range, image, radius, center, alpha, dtype=DEFAULT_DTYPE):
     emitters = emitter_coords(alpha, angle_range, detector_count, radius, center)
     detectors = detector_coords(alpha, angle_range, detector_count, radius, center)
     lines = draw_lines(emitters, detectors)
-    result = rescale(np.array([np.sum(image[tuple(line)]) for line in lines]))
-    return result
+    result = np.array([np.sum(image[tuple(line)]) for line in lines], dtype=dtype)
+    return rescale(result, in_place=True)
 
-def radon_all(image, scan_count, detector_count, angle_range):
+def radon_all(image, scan_count, detector_count, angle_range, dtype=DEFAULT_DTYPE):
     image = image_pad(image)
     center = np.floor(np.array(image.shape) / 2).astype(int)
     width = height = image.shape[0]
     radius = width // 2
     alphas = np.linspace(0, 180, scan_count)
-    results = np.zeros((scan_count, detector_count))
+    results = np.zeros((scan_count, detector_count), dtype=dtype)
     
     for i, alpha in enumerate(alphas):
-        results[i] = radon(detector_count, angle_range, image, radius, center, alpha)
+        results[i] = radon(detector_count, angle_range, image, radius, center, alpha, dtype)
     
     return np.swapaxes(results, 0, 1)
 
@@ -107,17 +157,19 @@ def inverse_radon(image, num_of_lines, single_alpha_sinogram, alpha, detector_co
         image[tuple(line)] += single_alpha_sinogram[i]
         num_of_lines[tuple(line)] += 1
 
-def inverse_radon_all(shape, sinogram, angle_range, use_filter=False, original_image=None, rmse_log=None):
+def inverse_radon_all(shape, sinogram, angle_range, use_filter=False, original_image=None, rmse_log=None,
+                      dtype=DEFAULT_DTYPE):
 
     if use_filter:
-        sinogram = apply_filter_to_sinogram(sinogram)
+        sinogram = apply_filter_to_sinogram(sinogram, dtype=dtype)
     
     number_of_detectors, number_of_scans = sinogram.shape
     sinogram = np.swapaxes(sinogram, 0, 1)
     
-    result = np.zeros(shape)
-    result = image_pad(result)
-    num_of_lines = np.zeros(result.shape)
+    # Akumulator i mapa pokrycia alokowane raz, od razu w rozmiarze z paddingiem
+    result = np.zeros(pad_shape(shape), dtype=dtype)
+    num_of_lines = np.zeros(result.shape, dtype=count_dtype(number_of_scans * number_of_detectors))
+    scratch = np.empty_like(result) if rmse_log is not None and original_image is not None else None
     
     center = np.floor(np.array(result.shape) / 2).astype(int)
     width = height = result.shape[0]
@@ -127,18 +179,179 @@ def inverse_radon_all(shape, sinogram, angle_range, use_filter=False, original_i
     for i, alpha in enumerate(alphas):
         inverse_radon(result, num_of_lines, sinogram[i], alpha, number_of_detectors, angle_range, radius, center)
 
-        if rmse_log is not None and original_image is not None:
-            temp = result / np.maximum(num_of_lines, 1)
-            temp_rescaled = rescale(temp)
-            temp_unpadded = unpad(temp_rescaled, *shape)
-            rmse_log.append(calculate_rmse(original_image, temp_unpadded))
+        if scratch is not None:
+            np.copyto(scratch, num_of_lines)
+            np.maximum(scratch, 1, out=scratch)
+            np.divide(result, scratch, out=scratch)
+            rescale(scratch, in_place=True)
+            rmse_log.append(calculate_rmse(original_image, unpad(scratch, *shape)))
     
     # Unikaj dzielenia przez zero
-    num_of_lines[num_of_lines == 0] = 1
-    temp = result / num_of_lines
-    temp = rescale(temp)
-    temp = unpad(temp, *shape)
-    return temp
+    np.maximum(num_of_lines, 1, out=num_of_lines)
+    np.divide(result, num_of_lines, out=result)
+    rescale(result, in_place=True)
+    # Kopia, żeby nie trzymać w pamięci całego obrazu z paddingiem
+    return unpad(result, *shape).copy()
+
+
+def roi_box(shape, roi):
+    """
+    Zamienia ROI (top, left, bottom, right) albo maskę bool na prostokąt
+    (top, left, bottom, right) z końcami wyłącznie.
+    """
+    if isinstance(roi, np.ndarray) and roi.dtype == bool:
+        if roi.shape != tuple(shape):
+            raise ValueError("ROI mask must have the same shape as the image")
+        rows = np.flatnonzero(roi.any(axis=1))
+        cols = np.flatnonzero(roi.any(axis=0))
+        if rows.size == 0:
+            raise ValueError("ROI mask is empty")
+        return rows[0], cols[0], rows[-1] + 1, cols[-1] + 1
+    top, left, bottom, right = (int(v) for v in roi)
+    top, left = max(top, 0), max(left, 0)
+    bottom, right = min(bottom, shape[0]), min(right, shape[1])
+    if bottom <= top or right <= left:
+        raise ValueError("ROI does not overlap the image")
+    return top, left, bottom, right
+
+def inverse_radon_clipped(image, num_of_lines, single_alpha_sinogram, alpha, detector_count, angle_range,
+                          radius, center, lo, hi):
+    emitters = emitter_coords(alpha, angle_range, detector_count, radius, center)
+    detectors = detector_coords(alpha, angle_range, detector_count, radius, center)
+    xs, ys, ray_ids = clipped_lines(emitters, detectors, lo, hi)
+    height, width = image.shape
+    # Linia przechodzi przez piksel najwyżej raz, więc bincount sumuje jak +=
+    flat = (xs - lo[0]) * width + (ys - lo[1])
+    image += np.bincount(flat, weights=single_alpha_sinogram[ray_ids],
+                         minlength=height * width).reshape(image.shape).astype(image.dtype)
+    np.add(num_of_lines, np.bincount(flat, minlength=height * width).reshape(image.shape),
+           out=num_of_lines, casting='unsafe')
+
+def inverse_radon_roi(shape, sinogram, angle_range, roi, use_filter=False, dtype=DEFAULT_DTYPE):
+    """
+    Rekonstrukcja tylko wybranego fragmentu obrazu.
+    roi to (top, left, bottom, right) we współrzędnych oryginalnego obrazu
+    albo maska bool o kształcie shape (piksele poza maską są zerowane).
+    Jasność jest skalowana do 0-255 w obrębie ROI.
+    """
+    top, left, bottom, right = roi_box(shape, roi)
+
+    if use_filter:
+        sinogram = apply_filter_to_sinogram(sinogram, dtype=dtype)
+
+    number_of_detectors, number_of_scans = sinogram.shape
+    sinogram = np.swapaxes(sinogram, 0, 1)
+
+    # Przesunięcie obrazu w kwadracie z paddingiem, tak samo jak w unpad
+    side = pad_shape(shape)[0]
+    offset_y = side // 2 - shape[0] // 2
+    offset_x = side // 2 - shape[1] // 2
+    # circle_coords daje współrzędne ujemne (indeksowanie od końca tablicy),
+    # więc ROI przesuwamy o -side, żeby przycinać w tym samym układzie
+    lo = (top + offset_y - side, left + offset_x - side)
+    hi = (bottom - 1 + offset_y - side, right - 1 + offset_x - side)
+
+    result = np.zeros((bottom - top, right - left), dtype=dtype)
+    num_of_lines = np.zeros(result.shape, dtype=count_dtype(number_of_scans * number_of_detectors))
+
+    center = np.array([side // 2, side // 2])
+    radius = side // 2
+    alphas = np.linspace(0, 180, number_of_scans)
+
+    for i, alpha in enumerate(alphas):
+        inverse_radon_clipped(result, num_of_lines, sinogram[i], alpha, number_of_detectors, angle_range,
+                              radius, center, lo, hi)
+
+    np.maximum(num_of_lines, 1, out=num_of_lines)
+    np.divide(result, num_of_lines, out=result)
+    rescale(result, in_place=True)
+    if isinstance(roi, np.ndarray) and roi.dtype == bool:
+        result[~roi[top:bottom, left:right]] = 0
+    return result
+
+
+def scan_geometry(side, scan_count, detector_count, angle_range):
+    """
+    Linie wszystkich skanów dla obrazu side x side (po paddingu): dla każdego
+    kąta płaskie indeksy pikseli (int32), początki i długości kolejnych linii.
+    Zależy tylko od geometrii, więc można ją liczyć raz dla wielu obrazów.
+    """
+    center = np.array([side // 2, side // 2])
+    radius = side // 2
+    geometry = []
+    for alpha in np.linspace(0, 180, scan_count):
+        emitters = emitter_coords(alpha, angle_range, detector_count, radius, center)
+        detectors = detector_coords(alpha, angle_range, detector_count, radius, center)
+        lines = draw_lines(emitters, detectors)
+        lengths = np.array([line.shape[1] for line in lines])
+        starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        # Ujemne współrzędne z circle_coords indeksują od końca, jak w radon
+        pixels = np.concatenate(lines, axis=1) % side
+        flat = (pixels[0] * side + pixels[1]).astype(np.int32)
+        geometry.append((flat, starts, lengths))
+    return geometry
+
+def radon_batch(images, geometry, dtype=DEFAULT_DTYPE, progress=None):
+    """
+    radon_all dla kilku obrazów o tym samym kształcie naraz.
+    progress(i, preview) jest wołane po każdym kącie; preview() zwraca
+    dotychczasowe sinogramy.
+    """
+    padded = np.stack([image_pad(image) for image in images])
+    n, side = padded.shape[0], padded.shape[1]
+    flat_images = padded.reshape(n, side * side)
+    sum_dtype = np.result_type(padded.dtype, np.int64)
+    scan_count = len(geometry)
+    detector_count = len(geometry[0][1])
+    results = np.zeros((n, scan_count, detector_count), dtype=dtype)
+
+    for i, (flat, starts, _) in enumerate(geometry):
+        results[:, i] = np.add.reduceat(flat_images[:, flat], starts, axis=1, dtype=sum_dtype)
+        rescale_rows(results[:, i])
+        if progress is not None:
+            progress(i, lambda: np.swapaxes(results[:, :i + 1], 1, 2).copy())
+
+    return np.swapaxes(results, 1, 2)
+
+def finish_backprojection(result, num_of_lines, shape, side, in_place=False):
+    # Uśrednienie, rescale i unpad dla wyników inverse_radon_batch
+    if not in_place:
+        result = result.copy()
+    np.divide(result, np.maximum(num_of_lines, 1), out=result)
+    rescale_rows(result)
+    result = result.reshape(len(result), side, side)
+    starty = side // 2 - shape[0] // 2
+    startx = side // 2 - shape[1] // 2
+    return result[:, starty:starty + shape[0], startx:startx + shape[1]].copy()
+
+def inverse_radon_batch(shape, sinograms, geometry, use_filter=False, dtype=DEFAULT_DTYPE, progress=None):
+    """
+    inverse_radon_all dla kilku sinogramów o tej samej geometrii naraz.
+    progress(i, preview) jest wołane po każdym kącie; preview() zwraca
+    dotychczasowe rekonstrukcje.
+    """
+    if use_filter:
+        sinograms = [apply_filter_to_sinogram(sinogram, dtype=dtype) for sinogram in sinograms]
+    sinograms = np.stack(sinograms)
+
+    n, number_of_detectors, number_of_scans = sinograms.shape
+    side = pad_shape(shape)[0]
+    size = side * side
+    result = np.zeros((n, size), dtype=dtype)
+    num_of_lines = np.zeros(size, dtype=count_dtype(number_of_scans * number_of_detectors))
+    # Przesunięcia indeksów, żeby jedno np.add.at obsłużyło cały wsad
+    offsets = (np.arange(n) * size)[:, None]
+    result_flat = result.reshape(-1)
+
+    for i, (flat, starts, lengths) in enumerate(geometry):
+        np.add.at(num_of_lines, flat, 1)
+        # Sumowanie bezpośrednio do result, bez tymczasowej tablicy float64
+        weights = np.repeat(sinograms[:, :, i].astype(dtype, copy=False), lengths, axis=1)
+        np.add.at(result_flat, (flat + offsets).ravel(), weights.ravel())
+        if progress is not None:
+            progress(i, lambda: finish_backprojection(result, num_of_lines, shape, side))
+
+    return finish_backprojection(result, num_of_lines, shape, side, in_place=True)
 
 
 def calculate_rmse(original, reconstructed):
@@ -161,9 +374,9 @@ def create_filter_kernel(size=21):
             kernel[i] = -4 / (np.pi ** 2 * val ** 2)
     return kernel
 
-def apply_filter_to_sinogram(sinogram, kernel_size=21):
-    kernel = create_filter_kernel(kernel_size)
-    filtered_sinogram = np.zeros_like(sinogram)
+def apply_filter_to_sinogram(sinogram, kernel_size=21, dtype=DEFAULT_DTYPE):
+    kernel = create_filter_kernel(kernel_size).astype(dtype)
+    filtered_sinogram = np.empty_like(sinogram, dtype=dtype)
     for i in range(sinogram.shape[0]):
         filtered_sinogram[i] = np.convolve(sinogram[i], kernel, mode='same')
     return filtered_sinogram
\ No newline at end of file
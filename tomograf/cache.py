@@ -0,0 +1,145 @@
+import glob
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+import numpy as np
+
+
+def image_hash(image):
+    """
+    Hash of the image content (shape, dtype and pixel data).
+    """
+    image = np.ascontiguousarray(image)
+    h = hashlib.sha1()
+    h.update(str(image.shape).encode())
+    h.update(str(image.dtype).encode())
+    h.update(image.tobytes())
+    return h.hexdigest()
+
+
+class ResultCache:
+    """
+    LRU cache of numpy arrays (sinograms, filtered sinograms, reconstructions)
+    limited by total size in bytes. If cache_dir is given, entries are also
+    stored as .npy files, so they survive between sessions; the files are
+    limited to max_disk_bytes in the same LRU way and written in a
+    background thread.
+    Safe to share between threads.
+    """
+
+    def __init__(self, max_bytes=256 * 1024 * 1024, cache_dir=None, max_disk_bytes=1024 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.cache_dir = cache_dir
+        self.entries = OrderedDict()
+        self.size = 0
+        self.disk_entries = OrderedDict()
+        self.disk_size = 0
+        self.pending = set()
+        self.writer = None
+        self.lock = threading.RLock()
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            self.writer = ThreadPoolExecutor(max_workers=1)
+            # Pliki z poprzednich sesji, od najdawniej używanych
+            for path in sorted(glob.glob(os.path.join(cache_dir, "*.npy")), key=os.path.getmtime):
+                size = os.path.getsize(path)
+                self.disk_entries[path] = size
+                self.disk_size += size
+            self._evict_disk()
+
+    def _file_path(self, key):
+        digest = hashlib.sha1(repr(key).encode()).hexdigest()
+        return os.path.join(self.cache_dir, f"{digest}.npy")
+
+    def _store(self, key, array):
+        array.flags.writeable = False
+        if key in self.entries:
+            self.size -= self.entries.pop(key).nbytes
+        self.entries[key] = array
+        self.size += array.nbytes
+        # Usuń najdawniej używane wpisy, ale zostaw przynajmniej bieżący
+        while self.size > self.max_bytes and len(self.entries) > 1:
+            _, old = self.entries.popitem(last=False)
+            self.size -= old.nbytes
+
+    def _evict_disk(self):
+        while self.disk_size > self.max_disk_bytes and len(self.disk_entries) > 1:
+            path, size = self.disk_entries.popitem(last=False)
+            self.disk_size -= size
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _save(self, path, array):
+        # Zapis do pliku tymczasowego, żeby get nie trafił na niepełny plik
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, array)
+        os.replace(tmp_path, path)
+        with self.lock:
+            if path in self.disk_entries:
+                self.disk_size -= self.disk_entries.pop(path)
+            self.disk_entries[path] = os.path.getsize(path)
+            self.disk_size += self.disk_entries[path]
+            self._evict_disk()
+
+    def get(self, key):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return self.entries[key]
+            if self.cache_dir is not None:
+                path = self._file_path(key)
+                if path in self.disk_entries:
+                    try:
+                        array = np.load(path)
+                        os.utime(path)
+                    except (OSError, ValueError):
+                        return None
+                    self.disk_entries.move_to_end(path)
+                    self._store(key, array)
+                    return array
+            return None
+
+    def put(self, key, array):
+        array = np.array(array)
+        with self.lock:
+            self._store(key, array)
+            if self.writer is not None:
+                future = self.writer.submit(self._save, self._file_path(key), array)
+                self.pending.add(future)
+                future.add_done_callback(self._done)
+        return array
+
+    def _done(self, future):
+        with self.lock:
+            self.pending.discard(future)
+
+    def get_or_compute(self, key, compute):
+        array = self.get(key)
+        if array is None:
+            array = self.put(key, compute())
+        return array
+
+    def flush(self):
+        # Czeka na zakończenie zapisów na dysk
+        with self.lock:
+            pending = list(self.pending)
+        wait(pending)
+
+    def clear(self):
+        self.flush()
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+            for path in self.disk_entries:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self.disk_entries.clear()
+            self.disk_size = 0
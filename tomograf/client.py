@@ -0,0 +1,68 @@
+import json
+import urllib.request
+from protocol import DEFAULT_HOST, DEFAULT_PORT, encode_array, decode_array
+
+
+class ReconstructionClient:
+    """
+    Klient lokalnego serwera z server.py.
+    on_progress(index, total) jest wołane po każdym kącie,
+    on_preview(index, array) dla podglądów co preview_every kątów.
+    """
+
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, timeout=None):
+        self.url = f"http://{host}:{port}"
+        self.timeout = timeout
+        # Bez proxy z ustawień systemu - serwer jest zawsze lokalny
+        self.opener = urllib.request.build_opener(urllib.request.ProxyHandler({}))
+
+    def health(self):
+        with self.opener.open(self.url + "/health", timeout=self.timeout) as response:
+            return json.loads(response.read())
+
+    def radon(self, image, scan_count, detector_count, angle_range,
+              on_progress=None, on_preview=None, preview_every=0):
+        payload = {
+            "image": encode_array(image),
+            "scan_count": scan_count,
+            "detector_count": detector_count,
+            "angle_range": angle_range,
+            "preview_every": preview_every,
+        }
+        return self.run("/radon", payload, on_progress, on_preview)
+
+    def reconstruct(self, shape, sinogram, angle_range, use_filter=False,
+                    on_progress=None, on_preview=None, preview_every=0):
+        payload = {
+            "sinogram": encode_array(sinogram),
+            "shape": list(shape),
+            "angle_range": angle_range,
+            "use_filter": use_filter,
+            "preview_every": preview_every,
+        }
+        return self.run("/reconstruct", payload, on_progress, on_preview)
+
+    def events(self, path, payload):
+        request = urllib.request.Request(
+            self.url + path,
+            data=json.dumps(payload).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+        )
+        with self.opener.open(request, timeout=self.timeout) as response:
+            for line in response:
+                if line.strip():
+                    yield json.loads(line)
+
+    def run(self, path, payload, on_progress=None, on_preview=None):
+        for event in self.events(path, payload):
+            if event["event"] == "progress":
+                if on_progress is not None:
+                    on_progress(event["index"], event["total"])
+            elif event["event"] == "preview":
+                if on_preview is not None:
+                    on_preview(event["index"], decode_array(event["data"]))
+            elif event["event"] == "result":
+                return decode_array(event["data"])
+            elif event["event"] == "error":
+                raise RuntimeError(event["message"])
+        raise RuntimeError("Connection closed before the result was received")
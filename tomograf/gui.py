@@ -4,7 +4,10 @@ import numpy as np
 from PIL import Image, ImageTk
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-from algorithms import radon_all, inverse_radon_all, calculate_rmse
+from matplotlib.widgets import RectangleSelector
+from matplotlib.patches import Rectangle
+from algorithms import radon_all, inverse_radon_all, inverse_radon_roi, calculate_rmse, apply_filter_to_sinogram
+from cache import ResultCache, image_hash
 import pydicom
 from dicom_handler import save_as_dicom
 import subprocess
@@ -14,7 +17,7 @@ import shlex
 import sys
 
 class CTScannerApp:
-    def __init__(self, root):
+    def __init__(self, root, cache_dir=None):
         self.root = root
         self.root.title("CT Scanner Simulation")
         self.loaded_image_path = None
@@ -37,6 +40,14 @@ class CTScannerApp:
         self.angles = None
         self.animation_id = None
         self.full_sinogram = None
+        self.image_hash = None
+        self.sinogram_params = None
+        self.roi = None
+        self.roi_reconstruction = None
+        self.roi_selector = None
+        
+        # Cache wyników (sinogramy, przefiltrowane sinogramy, rekonstrukcje)
+        self.cache = ResultCache(cache_dir=cache_dir)
         
         # Set up UI components
         self.setup_ui()
@@ -72,6 +83,7 @@ class CTScannerApp:
         Button(control_frame, text="Load DICOM", command=self.load_dicom, width=20).pack(pady=5)
         Button(control_frame, text="Generate Sinogram", command=self.generate_sinogram, width=20).pack(pady=5)
         Button(control_frame, text="Reconstruct Image", command=self.reconstruct_image, width=20).pack(pady=5)
+        Button(control_frame, text="Clear ROI", command=self.clear_roi, width=20).pack(pady=5)
         Button(control_frame, text="Calculate RMSE", command=self.calculate_and_show_rmse, width=20).pack(pady=5)
         Button(control_frame, text="Save as DICOM", command=self.save_dicom, width=20).pack(pady=5)
         Button(analysis_frame, text="Run RMSE Experiment", command=self.run_rmse_experiment, width=20).pack(pady=5)
@@ -143,13 +155,17 @@ class CTScannerApp:
                     new_size = (int(img.size[0] * scale), int(img.size[1] * scale))
                     img = img.resize(new_size, Image.LANCZOS)
                 self.original_image = np.array(img)
+                self.image_hash = image_hash(self.original_image)
                 self.loaded_image_path = file_path 
                 self.update_display()
                 # Reset other data
                 self.sinogram = None
+                self.sinogram_params = None
                 self.reconstructed_image = None
                 self.current_sinogram = None
                 self.current_reconstruction = None
+                self.roi = None
+                self.roi_reconstruction = None
                 self.reset_animation()
             except Exception as e:
                 messagebox.showerror("Error", f"Error loading image: {str(e)}")
@@ -162,11 +178,15 @@ class CTScannerApp:
             try:
                 ds = pydicom.dcmread(file_path)
                 self.original_image = ds.pixel_array
+                self.image_hash = image_hash(self.original_image)
                 self.update_display()
                 self.sinogram = None
+                self.sinogram_params = None
                 self.reconstructed_image = None
                 self.current_sinogram = None
                 self.current_reconstruction = None
+                self.roi = None
+                self.roi_reconstruction = None
                 self.reset_animation()
             except Exception as e:
                 messagebox.showerror("Error", f"Error loading DICOM file: {str(e)}")
@@ -178,14 +198,13 @@ class CTScannerApp:
         
         try:
             # Generate sinogram
-            self.sinogram = radon_all(
-                self.original_image, 
-                int(180 / self.angle_step), 
-                self.detector_count, 
-                self.span_angle
-            )
+            self.sinogram = self.get_sinogram()
+            self.sinogram_params = self.current_params()
+            self.roi_reconstruction = None
             self.update_display()
             self.reset_animation()
+            # Zaznaczone ROI liczymy od razu dla nowego sinogramu
+            self.reconstruct_roi()
         except Exception as e:
             messagebox.showerror("Error", f"Error generating sinogram: {str(e)}")
     
@@ -195,16 +214,86 @@ class CTScannerApp:
             return
         
         try:
-            self.reconstructed_image = inverse_radon_all(
-                self.original_image.shape, 
-                self.sinogram, 
-                self.span_angle,
-                use_filter = self.use_filter
+            params = self.sinogram_params + (self.use_filter,)
+            if self.use_filter:
+                sinogram = self.cache.get_or_compute(
+                    ("filtered",) + params,
+                    lambda: apply_filter_to_sinogram(self.sinogram)
+                )
+            else:
+                sinogram = self.sinogram
+            self.reconstructed_image = self.cache.get_or_compute(
+                ("reconstruction",) + params,
+                lambda: inverse_radon_all(
+                    self.original_image.shape, 
+                    sinogram, 
+                    self.sinogram_params[3]
+                )
             )
+            # Pokazujemy ostatni wynik, czyli pełny obraz (na nim działa zapis i RMSE)
+            self.roi_reconstruction = None
             self.update_display()
         except Exception as e:
             messagebox.showerror("Error", f"Error reconstructing image: {str(e)}")
 
+    def reconstruct_roi(self):
+        if self.sinogram is None or self.roi is None:
+            return
+        
+        try:
+            params = self.sinogram_params + (self.use_filter,)
+            self.roi_reconstruction = self.cache.get_or_compute(
+                ("roi",) + params + (self.roi,),
+                lambda: inverse_radon_roi(
+                    self.original_image.shape,
+                    self.sinogram,
+                    self.sinogram_params[3],
+                    self.roi,
+                    use_filter=self.use_filter
+                )
+            )
+            self.update_display()
+        except Exception as e:
+            messagebox.showerror("Error", f"Error reconstructing ROI: {str(e)}")
+
+    def on_roi_selected(self, eclick, erelease):
+        if self.original_image is None or eclick.xdata is None or erelease.xdata is None:
+            return
+        rows, cols = self.original_image.shape[:2]
+        # Współrzędne osi imshow: x - kolumna, y - wiersz
+        left = int(np.clip(np.floor(min(eclick.xdata, erelease.xdata) + 0.5), 0, cols))
+        right = int(np.clip(np.floor(max(eclick.xdata, erelease.xdata) + 0.5) + 1, 0, cols))
+        top = int(np.clip(np.floor(min(eclick.ydata, erelease.ydata) + 0.5), 0, rows))
+        bottom = int(np.clip(np.floor(max(eclick.ydata, erelease.ydata) + 0.5) + 1, 0, rows))
+        if bottom <= top or right <= left:
+            return
+        self.roi = (top, left, bottom, right)
+        self.roi_reconstruction = None
+        if self.sinogram is None:
+            self.update_display()
+        else:
+            self.reconstruct_roi()
+
+    def clear_roi(self):
+        self.roi = None
+        self.roi_reconstruction = None
+        self.update_display()
+
+    def current_params(self):
+        # Klucz cache: (hash obrazu, liczba detektorów, krok kąta, rozpiętość)
+        return (self.image_hash, self.detector_count, self.angle_step, self.span_angle)
+
+    def get_sinogram(self):
+        return self.cache.get_or_compute(
+            ("sinogram",) + self.current_params(),
+            lambda: radon_all(
+                self.original_image,
+                int(180 / self.angle_step),
+                self.detector_count,
+                self.span_angle
+            )
+        )
+
     def save_dicom(self):
         if self.reconstructed_image is None:
             messagebox.showwarning("Warning", "No reconstructed image to save as DICOM.")
@@ -268,6 +357,14 @@ class CTScannerApp:
         ax1 = self.fig.add_subplot(131)
         if self.original_image is not None:
             ax1.imshow(self.original_image, cmap='gray')
+            if self.roi is not None:
+                top, left, bottom, right = self.roi
+                ax1.add_patch(Rectangle((left - 0.5, top - 0.5), right - left, bottom - top,
+                                        fill=False, edgecolor='red'))
+            # Zaznaczenie myszą wybiera ROI do rekonstrukcji
+            self.roi_selector = RectangleSelector(ax1, self.on_roi_selected, useblit=False,
+                                                  button=[1], minspanx=2, minspany=2,
+                                                  spancoords='data')
         ax1.set_title("Original Image")
         ax1.axis('off')
         
@@ -282,11 +379,17 @@ class CTScannerApp:
         
         # Display reconstructed image
         ax3 = self.fig.add_subplot(133)
+        title = "Reconstructed Image"
         if self.current_reconstruction is not None:
             ax3.imshow(self.current_reconstruction, cmap='gray')
+        elif self.roi_reconstruction is not None:
+            top, left, bottom, right = self.roi
+            ax3.imshow(self.roi_reconstruction, cmap='gray',
+                       extent=(left - 0.5, right - 0.5, bottom - 0.5, top - 0.5))
+            title = "Reconstructed ROI"
         elif self.reconstructed_image is not None:
             ax3.imshow(self.reconstructed_image, cmap='gray')
-        ax3.set_title("Reconstructed Image")
+        ax3.set_title(title)
         ax3.axis('off')
 
         
@@ -309,6 +412,12 @@ class CTScannerApp:
     
     def toggle_filter(self):
         self.use_filter = self.filter_var.get()
+        # Rekonstrukcja dla drugiego ustawienia filtra zwykle jest już w cache
+        showing_roi = self.roi_reconstruction is not None
+        if self.reconstructed_image is not None:
+            self.reconstruct_image()
+        if showing_roi:
+            self.reconstruct_roi()
     
     def calculate_and_show_rmse(self):
         if self.original_image is None or self.reconstructed_image is None:
@@ -323,13 +432,8 @@ class CTScannerApp:
             messagebox.showwarning("Warning", "Please load an image first")
             return
 
-        # Precompute full sinogram once
-        self.full_sinogram = radon_all(
-            self.original_image,
-            int(180 / self.angle_step),
-            self.detector_count,
-            self.span_angle
-        )
+        # Precompute full sinogram once (or take it from the cache)
+        self.full_sinogram = self.get_sinogram()
 
         self.is_animation_running = True
         self.animate()
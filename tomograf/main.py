@@ -1,9 +1,11 @@
 from gui import CTScannerApp
 import tkinter as tk
+import os
 
 def main():
     root = tk.Tk()
-    app = CTScannerApp(root)
+    # Ustaw TOMOGRAF_CACHE_DIR, żeby zachować cache wyników między sesjami
+    app = CTScannerApp(root, cache_dir=os.environ.get("TOMOGRAF_CACHE_DIR"))
     root.geometry("1200x800")
     root.mainloop()
 
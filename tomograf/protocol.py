@@ -0,0 +1,28 @@
+import base64
+import json
+import numpy as np
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+
+def encode_array(array):
+    """
+    Zamienia tablicę numpy na słownik do wysłania w JSON.
+    """
+    array = np.ascontiguousarray(array)
+    return {
+        "dtype": str(array.dtype),
+        "shape": list(array.shape),
+        "data": base64.b64encode(array.tobytes()).decode("ascii"),
+    }
+
+
+def decode_array(data):
+    array = np.frombuffer(base64.b64decode(data["data"]), dtype=np.dtype(data["dtype"]))
+    return array.reshape(data["shape"]).copy()
+
+
+def encode_event(event):
+    # Jedno zdarzenie = jedna linia JSON (NDJSON)
+    return (json.dumps(event) + "\n").encode("utf-8")
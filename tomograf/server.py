@@ -0,0 +1,246 @@
+import argparse
+import json
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from algorithms import pad_shape, scan_geometry, radon_batch, inverse_radon_batch
+from cache import ResultCache, image_hash
+from protocol import DEFAULT_HOST, DEFAULT_PORT, encode_array, decode_array, encode_event
+
+
+class GeometryCache:
+    """
+    LRU cache of scan_geometry results limited by total size in bytes.
+    A geometry larger than the whole limit is computed but not kept.
+    """
+
+    def __init__(self, max_bytes=512 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def get(self, side, scan_count, detector_count, angle_range):
+        key = (side, scan_count, detector_count, angle_range)
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return self.entries[key][0]
+        # Liczone poza blokadą, żeby nie wstrzymywać innych wsadów
+        geometry = scan_geometry(side, scan_count, detector_count, angle_range)
+        nbytes = sum(flat.nbytes + starts.nbytes + lengths.nbytes for flat, starts, lengths in geometry)
+        if nbytes > self.max_bytes:
+            return geometry
+        with self.lock:
+            if key not in self.entries:
+                self.entries[key] = (geometry, nbytes)
+                self.size += nbytes
+            while self.size > self.max_bytes:
+                _, (_, old_nbytes) = self.entries.popitem(last=False)
+                self.size -= old_nbytes
+        return geometry
+
+
+class Job:
+    def __init__(self, kind, key, array, cache_key, preview_every=0, shape=None, use_filter=False):
+        self.kind = kind
+        self.key = key
+        self.array = array
+        self.cache_key = cache_key
+        self.preview_every = preview_every
+        self.shape = shape
+        self.use_filter = use_filter
+        self.events = queue.Queue()
+
+
+class BatchWorker:
+    """
+    Zbiera zadania o tej samej geometrii, które przyszły w oknie batch_window,
+    i liczy je jednym wsadowym przebiegiem w puli wątków.
+    """
+
+    def __init__(self, cache, geometry_cache, workers=2, batch_window=0.05, max_batch=8):
+        self.cache = cache
+        self.geometry_cache = geometry_cache
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.jobs = queue.Queue()
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        threading.Thread(target=self.collect, daemon=True).start()
+
+    def submit(self, job):
+        self.jobs.put(job)
+
+    def collect(self):
+        while True:
+            first = self.jobs.get()
+            batch = [first]
+            other = []
+            deadline = time.monotonic() + self.batch_window
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    job = self.jobs.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if job.key == first.key:
+                    batch.append(job)
+                else:
+                    other.append(job)
+            # Zadania z inną geometrią trafią do kolejnych wsadów
+            for job in other:
+                self.jobs.put(job)
+            self.pool.submit(self.run, batch)
+
+    def run(self, batch):
+        first = batch[0]
+        try:
+            scan_count, detector_count, angle_range = first.key[2:5]
+            side = pad_shape(first.key[1])[0]
+            geometry = self.geometry_cache.get(side, scan_count, detector_count, angle_range)
+            progress = self.progress_callback(batch, scan_count)
+            arrays = [job.array for job in batch]
+            if first.kind == "radon":
+                results = radon_batch(arrays, geometry, progress=progress)
+            else:
+                results = inverse_radon_batch(first.shape, arrays, geometry, use_filter=first.use_filter,
+                                              progress=progress)
+            for job, result in zip(batch, results):
+                result = self.cache.put(job.cache_key, result)
+                job.events.put({"event": "result", "batch_size": len(batch), "data": encode_array(result)})
+        except Exception as e:
+            for job in batch:
+                job.events.put({"event": "error", "message": str(e)})
+        finally:
+            for job in batch:
+                job.events.put(None)
+
+    def progress_callback(self, batch, total):
+        def progress(i, preview):
+            previews = None
+            for k, job in enumerate(batch):
+                job.events.put({"event": "progress", "index": i, "total": total})
+                if job.preview_every and (i + 1) % job.preview_every == 0:
+                    # Podgląd liczony raz dla całego wsadu
+                    if previews is None:
+                        previews = preview()
+                    job.events.put({"event": "preview", "index": i, "data": encode_array(previews[k])})
+        return progress
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    server_version = "TomografServer/1.0"
+
+    def do_GET(self):
+        if self.path != "/health":
+            self.send_error(404)
+            return
+        self.send_json(200, {"status": "ok", "cached_bytes": self.server.cache.size,
+                             "geometry_bytes": self.server.worker.geometry_cache.size})
+
+    def do_POST(self):
+        if self.path not in ("/radon", "/reconstruct"):
+            self.send_error(404)
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            payload = json.loads(self.rfile.read(length))
+            job = self.make_job(payload)
+        except (ValueError, KeyError, TypeError) as e:
+            self.send_json(400, {"event": "error", "message": f"Bad request: {e}"})
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        try:
+            cached = self.server.cache.get(job.cache_key)
+            if cached is not None:
+                self.write_event({"event": "result", "cached": True, "data": encode_array(cached)})
+                return
+            self.server.worker.submit(job)
+            while True:
+                event = job.events.get()
+                if event is None:
+                    break
+                self.write_event(event)
+        except (BrokenPipeError, ConnectionResetError):
+            # Klient się rozłączył; wynik i tak trafi do cache
+            pass
+
+    def make_job(self, payload):
+        preview_every = int(payload.get("preview_every", 0))
+        angle_range = float(payload["angle_range"])
+        if self.path == "/radon":
+            image = decode_array(payload["image"])
+            scan_count = int(payload["scan_count"])
+            detector_count = int(payload["detector_count"])
+            key = ("radon", image.shape, scan_count, detector_count, angle_range)
+            cache_key = ("sinogram", image_hash(image), scan_count, detector_count, angle_range)
+            return Job("radon", key, image, cache_key, preview_every)
+        sinogram = decode_array(payload["sinogram"])
+        shape = tuple(int(v) for v in payload["shape"])
+        use_filter = bool(payload.get("use_filter", False))
+        detector_count, scan_count = sinogram.shape
+        key = ("reconstruct", shape, scan_count, detector_count, angle_range, use_filter)
+        cache_key = ("reconstruction", image_hash(sinogram), shape, angle_range, use_filter)
+        return Job("reconstruct", key, sinogram, cache_key, preview_every, shape, use_filter)
+
+    def write_event(self, event):
+        self.wfile.write(encode_event(event))
+        self.wfile.flush()
+
+    def send_json(self, code, body):
+        data = encode_event(body)
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class ReconstructionServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, workers=2, batch_window=0.05, max_batch=8,
+                 cache_dir=None, verbose=False, geometry_cache_bytes=512 * 1024 * 1024):
+        super().__init__((host, port), RequestHandler)
+        self.cache = ResultCache(cache_dir=cache_dir)
+        self.worker = BatchWorker(self.cache, GeometryCache(geometry_cache_bytes), workers, batch_window, max_batch)
+        self.verbose = verbose
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local CT reconstruction server")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--batch-window", type=float, default=0.05, help="seconds to wait for a batch to fill")
+    parser.add_argument("--max-batch", type=int, default=8)
+    parser.add_argument("--cache-dir", default=None)
+    parser.add_argument("--geometry-cache-mb", type=float, default=512,
+                        help="memory limit for precomputed scan geometries")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    server = ReconstructionServer(args.host, args.port, args.workers, args.batch_window, args.max_batch,
+                                  args.cache_dir, args.verbose, int(args.geometry_cache_mb * 1024 * 1024))
+    print(f"Serving on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
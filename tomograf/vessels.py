@@ -0,0 +1,150 @@
+import argparse
+import glob
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from PIL import Image
+from scipy import ndimage
+from algorithms import apply_filter
+
+DEFAULT_INPUT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "dnooka")
+
+
+def vesselness(image, sigmas=(1, 2, 3, 4), beta=0.5, c=15):
+    """
+    Wieloskalowy filtr Frangiego dla ciemnych naczyń na jasnym tle.
+    c jest stałe (a nie liczone z obrazu), żeby kafelki dawały ten sam
+    wynik co cały obraz.
+    """
+    image = image.astype(np.float32)
+    result = np.zeros_like(image)
+    for sigma in sigmas:
+        # Hesjan znormalizowany skalą sigma^2
+        hrr = ndimage.gaussian_filter(image, sigma, order=(2, 0)) * sigma ** 2
+        hcc = ndimage.gaussian_filter(image, sigma, order=(0, 2)) * sigma ** 2
+        hrc = ndimage.gaussian_filter(image, sigma, order=(1, 1)) * sigma ** 2
+
+        tmp = np.sqrt((hrr - hcc) ** 2 + 4 * hrc ** 2)
+        l1 = (hrr + hcc + tmp) / 2
+        l2 = (hrr + hcc - tmp) / 2
+        # |l1| <= |l2|
+        swap = np.abs(l1) > np.abs(l2)
+        l1[swap], l2[swap] = l2[swap], l1[swap]
+
+        rb2 = (l1 / np.where(l2 == 0, 1e-10, l2)) ** 2
+        s2 = l1 ** 2 + l2 ** 2
+        v = np.exp(-rb2 / (2 * beta ** 2)) * (1 - np.exp(-s2 / (2 * c ** 2)))
+        v[l2 < 0] = 0
+        np.maximum(result, v, out=result)
+    return result
+
+
+def tile_margin(sigmas):
+    # Zasięg apply_filter (1 piksel) + zasięg filtru Gaussa (truncate=4)
+    return 1 + int(4 * max(sigmas) + 0.5) + 1
+
+
+def tiles(shape, tile_size):
+    rows, cols = shape
+    for top in range(0, rows, tile_size):
+        for left in range(0, cols, tile_size):
+            yield top, left, min(top + tile_size, rows), min(left + tile_size, cols)
+
+
+def process_tile(tile, core, sigmas, beta, c):
+    """
+    Filtruje kafelek z marginesem i zwraca tylko jego środek (core).
+    """
+    top, left, bottom, right = core
+    filtered = vesselness(apply_filter(tile), sigmas, beta, c)
+    return filtered[top:bottom, left:right]
+
+
+def load_fundus(image_path, mask_path):
+    # Naczynia są najlepiej widoczne w kanale zielonym
+    image = Image.open(image_path)
+    if image.mode != 'L':
+        image = image.convert('RGB').split()[1]
+    mask = np.array(Image.open(mask_path).convert('L')) > 0
+    return np.array(image), mask
+
+
+def enhance_image(executor, image, mask, tile_size, sigmas, beta, c):
+    rows, cols = image.shape
+    margin = tile_margin(sigmas)
+    result = np.zeros(image.shape, dtype=np.float32)
+    futures = {}
+    skipped = 0
+
+    for top, left, bottom, right in tiles(image.shape, tile_size):
+        # Kafelki całkowicie poza polem widzenia pomijamy
+        if not mask[top:bottom, left:right].any():
+            skipped += 1
+            continue
+        t, l = max(top - margin, 0), max(left - margin, 0)
+        b, r = min(bottom + margin, rows), min(right + margin, cols)
+        core = (top - t, left - l, bottom - t, right - l)
+        future = executor.submit(process_tile, image[t:b, l:r], core, sigmas, beta, c)
+        futures[future] = (top, left, bottom, right)
+
+    for future in as_completed(futures):
+        top, left, bottom, right = futures[future]
+        result[top:bottom, left:right] = future.result()
+
+    result[~mask] = 0
+    return result, len(futures), skipped
+
+
+def find_images(input_dir):
+    pairs = []
+    for image_path in sorted(glob.glob(os.path.join(input_dir, "*_h.jpg"))):
+        mask_path = image_path[:-len(".jpg")] + "_mask.tif"
+        if os.path.exists(mask_path):
+            pairs.append((image_path, mask_path))
+    return pairs
+
+
+def run_pipeline(input_dir, output_dir, tile_size=256, sigmas=(1, 2, 3, 4), beta=0.5, c=15, workers=None):
+    os.makedirs(output_dir, exist_ok=True)
+    pairs = find_images(input_dir)
+    if not pairs:
+        print(f"No *_h.jpg images with masks found in {input_dir}")
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for image_path, mask_path in pairs:
+            name = os.path.splitext(os.path.basename(image_path))[0]
+            start = time.perf_counter()
+
+            image, mask = load_fundus(image_path, mask_path)
+            result, processed, skipped = enhance_image(executor, image, mask, tile_size, sigmas, beta, c)
+
+            # Zapis od razu po przetworzeniu obrazu
+            max_val = result.max()
+            if max_val > 0:
+                result *= 255 / max_val
+            Image.fromarray(result.astype(np.uint8)).save(os.path.join(output_dir, f"{name}_vessels.png"))
+
+            elapsed = time.perf_counter() - start
+            megapixels = image.size / 1e6
+            print(f"{name}: {megapixels:.1f} Mpx in {elapsed:.2f} s ({megapixels / elapsed:.2f} Mpx/s), "
+                  f"tiles processed {processed}, skipped {skipped}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tiled vessel enhancement for fundus images")
+    parser.add_argument("input_dir", nargs="?", default=DEFAULT_INPUT)
+    parser.add_argument("--output-dir", default="results/vessels")
+    parser.add_argument("--tile-size", type=int, default=256)
+    parser.add_argument("--sigmas", type=float, nargs="+", default=[1, 2, 3, 4])
+    parser.add_argument("--beta", type=float, default=0.5)
+    parser.add_argument("--c", type=float, default=15)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    run_pipeline(args.input_dir, args.output_dir, args.tile_size, tuple(args.sigmas), args.beta, args.c,
+                 args.workers)
+
+if __name__ == "__main__":
+    main()